@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # scapy.contrib.description = Locator ID Separation Protocol
 # scapy.contrib.status = loads
 """
@@ -12,11 +12,14 @@
     Public License. See the file COPYING in the main directory of this
     archive for more details.
 """
+from __future__ import annotations
 
 import socket,struct,random,netifaces,sys,hmac,hashlib
 from string import ascii_letters
 from scapy import *
 from scapy.all import *
+from array import array
+from collections import OrderedDict
 
 """  GENERAL DECLARATIONS """
 
@@ -37,8 +40,8 @@ _LISP_MAP_REPLY_ACTIONS = {
 }
 
 _AFI = {
-    """ An AFI value of 0 used in this specification indicates an unspecified encoded address where the length of the address is 0 bytes following the 16-bit AFI value of 0. See the following URL for the other values:
-    http://www.iana.org/assignments/address-family-numbers/address-family-numbers.xml """
+    # An AFI value of 0 used in this specification indicates an unspecified encoded address where the length of the address is 0 bytes following the 16-bit AFI value of 0. See the following URL for the other values:
+    # http://www.iana.org/assignments/address-family-numbers/address-family-numbers.xml
 
     "zero" : 0,
     "ipv4" : 1,
@@ -52,6 +55,38 @@ _KEY_LENGTH = {
     2 : 32
 }
 
+""" hash function of the HMAC for each key id, key id 0 means no authentication """
+_KEY_DIGEST = {
+    1 : hashlib.sha1,
+    2 : hashlib.sha256
+}
+
+""" length in bytes of the address that follows an AFI, used when walking records without scapy fields """
+_AFI_LENGTH = {
+    0 : 0,
+    1 : 4,
+    2 : 16
+}
+
+""" precompiled layouts of the fixed size headers, see _dissect_header. struct.Struct parses the format once, every packet after that is a single C call """
+    # type and flags, record counts, nonce, source eid afi
+_MAP_REQUEST_HEADER = struct.Struct("!IQH")
+    # type and flags, record count, nonce
+_MAP_REPLY_HEADER = struct.Struct("!IQ")
+    # type and flags, record count, nonce, key id, authentication data length. shared by map register and map notify
+_MAP_AUTH_HEADER = struct.Struct("!IQHH")
+    # type and flags
+_ECM_HEADER = struct.Struct("!I")
+    # ttl, locator count, eid mask length, action/authoritative/reserved/map version bits, eid afi
+_MAP_RECORD_HEADER = struct.Struct("!IBBIH")
+    # priorities, weights, reserved/flag bits, locator afi
+_LOCATOR_HEADER = struct.Struct("!BBBBHH")
+    # reserved, eid mask length, eid afi
+_REQUEST_RECORD_HEADER = struct.Struct("!BBH")
+
+""" number of distinct map record lists kept by LISP_MapRecordListField, see there. 0 disables the cache """
+_MAP_RECORD_CACHE_SIZE = 1024
+
 """ nonce_max determines the maximum value of a nonce field. The default is set to 18446744073709551615, since this is the maximum possible value (>>> int('f'*16, 16)). TODO - see about the entropy for this source"""
 nonce_max = 16777215000
 nonce_min = 15000000000
@@ -62,69 +97,135 @@ scapy is designed to read out bytes before it can call another class. we are usi
 class LISP(Packet):
     name = "LISP"
 
-    def guess_payload_class(self, payload):
-       	# read the payload (non interpreted part of the packet string) into a variable
-    	a = payload[:1]
-		# put the hex from the packet remainder into an attribute
-        b = struct.unpack("B", a)
-		# shift the value from the attribute for 4 bits, so that we have only the 4 bit type value that we care about in the form of a byte. this means that flags are not taken into account in this value, which makes enumeration much cleaner and easier.
-        c = b[0] >> 4
-		
-		# compare the integer from the value to the packettype and continue to the correct class
-        if c == 1:
-            return LISP_MapRequest      
-        elif c == 2:
-            return LISP_MapReply
-        elif c == 3:
-            return LISP_MapRegister
-        elif c == 8:
-            return LISP_Encapsulated_Control_Message
-        else:
-            return payload
+    def guess_payload_class(self, payload: bytes):
+        # the packet type is the upper nibble of the first byte. it is read once and looked up in _LISP_PACKET_CLASSES (see the bottom of this file), the flags in the lower nibble are left to the type specific class.
+        return _LISP_PACKET_CLASSES[payload[0] >> 4]
 
     
-""" the class below reads the first byte of an unidentified IPv4 or IPv6 header. it then checks the first byte of the payload to see if its IPv4 or IPv6 header. the IPv4 header contains a byte to describe the IP version, which is always hex45. IPv6 has a 4 bit header, which is harder to read in scapy. maybe this can be done in a prettier way - TODO """
+""" the class below reads the first byte of an unidentified IPv4 or IPv6 header. the IP version is the upper nibble of that byte for both IPv4 and IPv6, so a single shift decides between the two (comparing the whole byte against hex45 would miss IPv4 headers carrying options). anything else is left as raw payload. """
 
 class LCAF_Type(Packet):
-    def guess_payload_class(self, payload):
-	a = payload[:1]
-        b = struct.unpack("B", a)
-        c = b[0] >> 4
-
-        if c == 4:
+    def guess_payload_class(self, payload: bytes):
+        version = payload[0] >> 4
+        if version == 4:
             return IP
-        elif c == 6:
+        elif version == 6:
             return IPv6
-        elif c == 16387:
-	        print "LCAF, WIP"
-        else:
-	        return payload
+        return conf.raw_layer
 
 """ 
 LISPAddressField, Dealing with addresses in LISP context, the packets often contain (afi, address) where the afi decides the length of the address (0, 32 or 128 bit). LISPAddressField will parse an IPField or an IP6Field depending on the value of the AFI field. 
 """
 
 class LISP_AddressField(Field):
-    __slots__ = ["fld_name", "_ip_field", "_ip6_field"]
+    __slots__ = ["fld_name", "_ip_field", "_ip6_field", "_ip_getfield", "_ip6_getfield", "_ip_addfield", "_ip6_addfield"]
+    # AFI values resolved once, so that the per address dispatch is a plain integer compare
+    _AFI_ZERO = _AFI["zero"]
+    _AFI_IPV4 = _AFI["ipv4"]
+    _AFI_IPV6 = _AFI["ipv6"]
+
     def __init__(self, fld_name, ip_fld_name):
         Field.__init__(self, ip_fld_name, '0')
 
         self.fld_name=fld_name
         self._ip_field=IPField(ip_fld_name, '127.0.0.1')
         self._ip6_field=IP6Field(ip_fld_name, '::1')
+        # bind the (de)serializers of the address fields, this saves an attribute lookup for every address
+        self._ip_getfield=self._ip_field.getfield
+        self._ip6_getfield=self._ip6_field.getfield
+        self._ip_addfield=self._ip_field.addfield
+        self._ip6_addfield=self._ip6_field.addfield
 
     def getfield(self, pkt, s):
-        if getattr(pkt, self.fld_name) == _AFI["ipv4"]:
-            return self._ip_field.getfield(pkt,s)
-        elif getattr(pkt, self.fld_name) == _AFI["ipv6"]:
-            return self._ip6_field.getfield(pkt,s)
+        afi = pkt.getfieldval(self.fld_name)
+        if afi == self._AFI_IPV4:
+            return self._ip_getfield(pkt, s)
+        elif afi == self._AFI_IPV6:
+            return self._ip6_getfield(pkt, s)
+        elif afi == self._AFI_ZERO:
+            # an unspecified address has a length of 0 bytes
+            return s, None
+        raise Scapy_Exception("LISP_AddressField: unsupported AFI %s" % afi)
 
     def addfield(self, pkt, s, val):
-        if getattr(pkt, self.fld_name) == _AFI["ipv4"]:
-            return self._ip_field.addfield(pkt, s, val)
-        elif getattr(pkt, self.fld_name) == _AFI["ipv6"]: 
-            return self._ip6_field.addfield(pkt, s, val)
-
+        afi = pkt.getfieldval(self.fld_name)
+        if afi == self._AFI_IPV4:
+            return self._ip_addfield(pkt, s, val)
+        elif afi == self._AFI_IPV6:
+            return self._ip6_addfield(pkt, s, val)
+        elif afi == self._AFI_ZERO:
+            return s
+        raise Scapy_Exception("LISP_AddressField: unsupported AFI %s" % afi)
+
+
+""" FIXED HEADER DISSECTION
+the LISP messages and records start with a fixed size header made up of bit fields and plain integers. instead of letting scapy read these one field at a time, a class can set do_dissect = _dissect_header and describe its header with two class attributes:
+    _header         a struct.Struct covering the whole fixed size header
+    _header_bits    (index, field name, shift, mask) for every field in the header, in fields_desc order. index selects the integer from the unpacked header, shift and mask cut the field out of it.
+the header is unpacked with a single struct call, the (variable length) fields after it are dissected by scapy as usual. """
+
+""" the value scapy keeps in raw_packet_cache_fields to notice later changes to a mutable field. the form differs between scapy versions (2.6 keeps the fields of packet values instead of copies of the packets), so it is taken from scapy when it knows how """
+def _raw_cache_value(pkt, f, fval):
+    if hasattr(pkt, "_raw_packet_cache_field_value"):
+        return pkt._raw_packet_cache_field_value(f, fval, copy=True)
+    return f.do_copy(fval)
+
+def _dissect_header(self, s):
+    header = self._header
+    if len(s) < header.size:
+        # truncated packet, leave it to scapy to dissect whatever is there
+        return Packet.do_dissect(self, s)
+    _raw = s
+    fields = self.fields
+    fieldtype = self.fieldtype
+    self.raw_packet_cache_fields = {}
+    words = header.unpack_from(s)
+    for i, name, shift, mask in self._header_bits:
+        f = fieldtype[name]
+        fval = f.m2i(self, (words[i] >> shift) & mask)
+        # flag values are mutable, keep a copy so scapy notices when they are changed (see Packet.do_dissect)
+        if f.ismutable:
+            self.raw_packet_cache_fields[name] = _raw_cache_value(self, f, fval)
+        fields[name] = fval
+    s = s[header.size:]
+    for f in self.fields_desc[len(self._header_bits):]:
+        if not s:
+            break
+        s, fval = f.getfield(self, s)
+        if isinstance(f, ConditionalField) and fval is None:
+            continue
+        if (f.islist or f.holds_packets or f.ismutable) and fval is not None:
+            self.raw_packet_cache_fields[f.name] = _raw_cache_value(self, f, fval)
+        fields[f.name] = fval
+    self.raw_packet_cache = _raw[:-len(s)] if s else _raw
+    self.explicit = 1
+    return s
+
+""" FIXED HEADER BUILDING
+the counterpart of _dissect_header, set self_build = _build_header on a class with _header and _header_bits. the header fields are shifted and masked into their integers and packed with a single struct call, the fields after the header are built by scapy one by one. the parts are joined once at the end, instead of growing an immutable string field by field (which copies everything built so far for every field and every record). """
+def _build_header(self):
+    if self.raw_packet_cache is not None:
+        # unchanged dissected packet, Packet.self_build returns the cached bytes
+        return Packet.self_build(self)
+    header = self._header
+    words = [0] * (self._header_bits[-1][0] + 1)
+    for i, name, shift, mask in self._header_bits:
+        val = self.getfieldval(name)
+        if isinstance(val, RawVal):
+            return Packet.self_build(self)
+        val = int(self.fieldtype[name].i2m(self, val))
+        if val & mask != val:
+            # out of range, let scapy truncate or complain about it as it always does
+            return Packet.self_build(self)
+        words[i] |= val << shift
+    parts = [header.pack(*words)]
+    for f in self.fields_desc[len(self._header_bits):]:
+        val = self.getfieldval(f.name)
+        if isinstance(val, RawVal):
+            parts.append(bytes(val))
+        else:
+            parts.append(f.addfield(self, b"", val))
+    return b"".join(parts)
 
 """RECORD FIELDS, PART OF THE REPLY, REQUEST, NOTIFY OR REGISTER PACKET CLASSES"""
 
@@ -137,7 +238,7 @@ class LISP_AFI_Address(Packet):                     # used for 4 byte fields tha
     ]
 
     def extract_padding(self, s):
-        return "", s
+        return b"", s
 
 """ Map Reply LOCATOR, page 28, paragraph 6.1.4, the LOCATOR appears N times dependant on the locator count in the record field """
 class LISP_Locator_Record(Packet):
@@ -153,16 +254,52 @@ class LISP_Locator_Record(Packet):
         LISP_AddressField("locator_afi", "address")
     ]
 
+    _header = _LOCATOR_HEADER
+    _header_bits = (
+        (0, "priority", 0, 0xff),
+        (1, "weight", 0, 0xff),
+        (2, "multicast_priority", 0, 0xff),
+        (3, "multicast_weight", 0, 0xff),
+        (4, "reserved", 3, 0x1fff),
+        (4, "locator_flags", 0, 0x7),
+        (5, "locator_afi", 0, 0xffff)
+    )
+    do_dissect = _dissect_header
+
     # delimits the packet, so that the remaining records are not contained as 'raw' payloads 
     def extract_padding(self, s):
-        return "", s
+        return b"", s
+
+""" LISP_LocatorListField, the locators of a map record. the length of a locator follows from its AFI, so every locator is cut from the record before it is dissected and the record is walked only once. a plain PacketListField dissects each locator with all remaining bytes attached as padding, and copies these bytes over again for every locator. """
+class LISP_LocatorListField(PacketListField):
+    __slots__ = []
+
+    def getfield(self, pkt, s):
+        lst = []
+        off = 0
+        end = len(s)
+        size = _LOCATOR_HEADER.size
+        for i in range(self.count_from(pkt)):
+            if off >= end:
+                break
+            alen = None
+            if off + size <= end:
+                alen = _AFI_LENGTH.get(_LOCATOR_HEADER.unpack_from(s, off)[5])
+            if alen is None or off + size + alen > end:
+                # truncated locator or an AFI we can not size, keep the rest as raw data like PacketListField does
+                lst.append(conf.raw_layer(load=s[off:]))
+                return b"", lst
+            nxt = off + size + alen
+            lst.append(self.m2i(pkt, s[off:nxt]))
+            off = nxt
+        return s[off:], lst
 
 """ Map Reply RECORD, page 28, paragraph 6.1.4, the RECORD appears N times dependant on Record Count """
 class LISP_MapRecord(Packet):
     name = "LISP Map-Reply Record"
     fields_desc = [
         BitField("record_ttl", 0, 32),
-        FieldLenField("locator_count",  None, "locators", "B", count_of="locators", adjust=lambda pkt,x:x/12),
+        FieldLenField("locator_count", None, fmt="B", count_of="locators"),
         ByteField("eid_prefix_length", 0),
         BitEnumField("action", 0, 3, _LISP_MAP_REPLY_ACTIONS),
         BitField("authoritative", 0, 1),
@@ -170,31 +307,179 @@ class LISP_MapRecord(Packet):
         BitField("map_version_number", 0, 12),
         ShortField("record_afi", int(1)),
         LISP_AddressField("record_afi", "record_address"),
-        PacketListField("locators", None, LISP_Locator_Record, count_from=lambda pkt: pkt.locator_count + 1)
+        LISP_LocatorListField("locators", None, LISP_Locator_Record, count_from=lambda pkt: pkt.locator_count)
     ]
 
+    # the action, authoritative, reserved and map version bits share a single 32 bit word (index 3), which is cut up with shifts and masks
+    _header = _MAP_RECORD_HEADER
+    _header_bits = (
+        (0, "record_ttl", 0, 0xffffffff),
+        (1, "locator_count", 0, 0xff),
+        (2, "eid_prefix_length", 0, 0xff),
+        (3, "action", 29, 0x7),
+        (3, "authoritative", 28, 0x1),
+        (3, "reserved", 12, 0xffff),
+        (3, "map_version_number", 0, 0xfff),
+        (4, "record_afi", 0, 0xffff)
+    )
+    do_dissect = _dissect_header
+
     # delimits the packet, so that the remaining records are not contained as 'raw' payloads
     def extract_padding(self, s):
-        return "", s
+        return b"", s
+
+""" BULK RECORD PARSING
+_parse_records walks map records straight from the packet bytes instead of building a LISP_MapRecord and LISP_Locator_Record packet for every entry. the result is column oriented: the integer fields are stored in typed array.array columns (one contiguous buffer per field instead of a python object per record), which is what consumers going through large captures want. addresses are variable length and are returned as lists of packed addresses, as they appear on the wire. locators refer to their record through the "record" column. passing in the columns of an earlier call appends to them, so the records of many packets end up in one set of columns. parsing stops early when the buffer runs out or an AFI of unknown length (e.g. LCAF) is found, since the next record can not be located after that. """
+def _parse_records(s, off, count, records=None, locators=None):
+    if records is None:
+        records = { "record_ttl" : array("I"), "locator_count" : array("B"), "eid_prefix_length" : array("B"), "action_flags" : array("I"), "record_afi" : array("H"), "record_address" : [] }
+        locators = { "record" : array("I"), "priority" : array("B"), "weight" : array("B"), "multicast_priority" : array("B"), "multicast_weight" : array("B"), "locator_flags" : array("B"), "locator_afi" : array("H"), "address" : [] }
+    end = len(s)
+    record_size = _MAP_RECORD_HEADER.size
+    unpack_record = _MAP_RECORD_HEADER.unpack_from
+    afi_length = _AFI_LENGTH.get
+    # the locator loop runs for every locator of every record, so everything it touches is bound to a local up front
+    locator_size = _LOCATOR_HEADER.size
+    unpack_locator = _LOCATOR_HEADER.unpack_from
+    add_record = locators["record"].append
+    add_priority = locators["priority"].append
+    add_weight = locators["weight"].append
+    add_multicast_priority = locators["multicast_priority"].append
+    add_multicast_weight = locators["multicast_weight"].append
+    add_flags = locators["locator_flags"].append
+    add_afi = locators["locator_afi"].append
+    add_address = locators["address"].append
+    for i in range(count):
+        if off + record_size > end:
+            break
+        ttl, loc_count, prefix_len, action_flags, afi = unpack_record(s, off)
+        off += record_size
+        alen = afi_length(afi)
+        if alen is None or off + alen > end:
+            break
+        r = len(records["record_ttl"])
+        records["record_ttl"].append(ttl)
+        records["locator_count"].append(loc_count)
+        records["eid_prefix_length"].append(prefix_len)
+        records["action_flags"].append(action_flags)
+        records["record_afi"].append(afi)
+        records["record_address"].append(s[off:off + alen])
+        off += alen
+        for l in range(loc_count):
+            if off + locator_size > end:
+                return records, locators
+            prio, weight, mprio, mweight, flags, lafi = unpack_locator(s, off)
+            off += locator_size
+            alen = afi_length(lafi)
+            if alen is None or off + alen > end:
+                return records, locators
+            add_record(r)
+            add_priority(prio)
+            add_weight(weight)
+            add_multicast_priority(mprio)
+            add_multicast_weight(mweight)
+            add_flags(flags & 0x7)
+            add_afi(lafi)
+            add_address(s[off:off + alen])
+            off += alen
+    return records, locators
+
+""" LISP_MapRecordListField, the list of map records carried by map replies, registers and notifies. mapping systems and replayed captures send the same records over and over again, so the records are kept in a small LRU cache keyed by the record count and the raw bytes. the cache holds the field values of the records as immutable tuples, never the record packets, and every hit builds new records from them: changing a dissected packet never touches the cache, and nothing in the cache points back at the packet that was dissected first. lists with anything but complete records (e.g. a truncated record that scapy left as raw data) are not cached. """
+_map_record_cache = OrderedDict()
+
+def _record_values(record):
+    # (field, value) pairs of a dissected packet, flag values are mutable and kept as plain integers
+    values = []
+    for name, val in record.fields.items():
+        if record.fieldtype[name].ismutable:
+            val = int(val)
+        values.append((name, val))
+    return tuple(values)
+
+def _record_from_values(cls, values, parent):
+    record = cls(**dict(values))
+    record.explicit = 1
+    if hasattr(record, "parent"):
+        record.parent = parent
+    return record
+
+class LISP_MapRecordListField(PacketListField):
+    __slots__ = []
+
+    def getfield(self, pkt, s):
+        if not _MAP_RECORD_CACHE_SIZE:
+            return PacketListField.getfield(self, pkt, s)
+        key = (self.count_from(pkt), s)
+        cached = _map_record_cache.pop(key, None)
+        if cached is None:
+            remain, lst = PacketListField.getfield(self, pkt, s)
+            values = []
+            for r in lst:
+                if not isinstance(r, self.cls) or not all(isinstance(l, LISP_Locator_Record) for l in r.locators):
+                    return remain, lst
+                fields = tuple(v for v in _record_values(r) if v[0] != "locators")
+                values.append((fields, tuple(_record_values(l) for l in r.locators)))
+            if len(_map_record_cache) >= _MAP_RECORD_CACHE_SIZE:
+                _map_record_cache.popitem(last=False)
+            _map_record_cache[key] = (remain, tuple(values))
+            return remain, lst
+        # reinsert as most recently used
+        _map_record_cache[key] = cached
+        remain, values = cached
+        records = []
+        for fields, locators in values:
+            record = _record_from_values(self.cls, fields, pkt)
+            record.fields["locators"] = [_record_from_values(LISP_Locator_Record, l, record) for l in locators]
+            records.append(record)
+        return remain, records
 
 """ Map Request RECORD, page 25, paragraph 6.1.2, the 'REC', appears N times depending on record count """
 class LISP_MapRequestRecord(Packet):
     name= "LISP Map-Request Record"
     fields_desc = [
         ByteField("reserved", 0),
-	        # eid mask length
+                # eid mask length
         ByteField("eid_mask_len", 24),
-        	# eid prefix afi
+                # eid prefix afi
         ShortField("request_afi", int(1)),
-	        # eid prefix information + afi
+                # eid prefix information + afi
         LISP_AddressField("request_afi", "request_address")
     ]
+
+    _header = _REQUEST_RECORD_HEADER
+    _header_bits = (
+        (0, "reserved", 0, 0xff),
+        (1, "eid_mask_len", 0, 0xff),
+        (2, "request_afi", 0, 0xffff)
+    )
+    do_dissect = _dissect_header
    
     def extract_padding(self, s):
-        return "", s
+        return b"", s
 
 """PACKET TYPES (REPLY, REQUEST, NOTIFY OR REGISTER)"""
 
+""" the ptype field of the packet types below is a plain integer, its name is only looked up in _LISP_TYPES when asked for through the ptype_name property """
+def _ptype_name(self):
+    return _LISP_TYPES.get(self.ptype, "unknown")
+
+""" checks the authentication data of a map register or map notify against key. the HMAC covers the whole message with the authentication data set to zero. a dissected layer is checked as it was received, over its original bytes. a layer built from its fields, or changed since it was dissected, is checked over its fields as they are: authentication_length and authentication_data have to be set, post_build does not run and nothing is signed here. to check what bytes() of a map register sends, dissect those bytes first. the message goes through a memoryview, so it is not copied to zero the authentication data. returns False when the key id has no HMAC or the message is truncated """
+def _verify_auth(self, key):
+    digest = _KEY_DIGEST.get(self.key_id)
+    if digest is None:
+        return False
+    p = self.self_build()
+    off = _MAP_AUTH_HEADER.size
+    end = off + self.authentication_length
+    if len(p) < end:
+        return False
+    mv = memoryview(p)
+    mac = hmac.new(key, digestmod=digest)
+    mac.update(mv[:off])
+    mac.update(b"\x00" * (end - off))
+    mac.update(mv[end:])
+    return hmac.compare_digest(mac.digest(), p[off:end])
+
 class LISP_MapRequest(Packet):
     """ map request part used after the first 16 bits have been read by the LISP_Type class"""
     name = "LISP Map-Request packet"
@@ -203,12 +488,10 @@ class LISP_MapRequest(Packet):
         FlagsField("request_flags", None, 6, ["authoritative", "map_reply_included", "probe", "smr", "pitr", "smr_invoked"]),
         BitField("p1", 0, 6),
             # right now we steal 3 extra bits from the reserved fields that are prior to the itr_rloc_records
-	    # the lambda you see below, checks for the length of the 'itr_rloc_records' by going from the largest possible IP + AFI record (IPv6 = 18 bytes) to the smallest one (IPv4 = 6 bytes). The entry in the middle (%12) takes care of dual IPv4 records. 
-	    # TODO - get the 2 record limitation worked out. 
-        FieldLenField("itr_rloc_count", None, "itr_rloc_records", "B", count_of="itr_rloc_records", adjust=lambda pkt,x:((not (x%18) and (x/18-1)) or ((not (x%12) and (x/12-1)) or ((not x%6) and (x/6-1))))),                
-	FieldLenField("request_count", None, "request_records", "B", count_of="request_records", adjust=lambda pkt,x:x/8),  
+        FieldLenField("itr_rloc_count", None, fmt="B", count_of="itr_rloc_records", adjust=lambda pkt,x:x - 1),    # the ITR-RLOC count is encoded as the number of ITR-RLOCs minus one
+        FieldLenField("request_count", None, fmt="B", count_of="request_records"),
         XLongField("nonce", random.randint(nonce_min, nonce_max)),
-	    # below, the source address of the request is listed, this occurs once per packet
+            # below, the source address of the request is listed, this occurs once per packet
         ShortField("request_afi", int(1)),
             # the LISP IP address field is conditional, because it is absent if the AFI is set to 0
         ConditionalField(LISP_AddressField("request_afi", "address"), lambda pkt:pkt.request_afi != 0),
@@ -216,6 +499,19 @@ class LISP_MapRequest(Packet):
         PacketListField("request_records", None, LISP_MapRequestRecord, count_from=lambda pkt: pkt.request_count) 
     ]
 
+    _header = _MAP_REQUEST_HEADER
+    _header_bits = (
+        (0, "ptype", 28, 0xf),
+        (0, "request_flags", 22, 0x3f),
+        (0, "p1", 16, 0x3f),
+        (0, "itr_rloc_count", 8, 0xff),
+        (0, "request_count", 0, 0xff),
+        (1, "nonce", 0, 0xffffffffffffffff),
+        (2, "request_afi", 0, 0xffff)
+    )
+    do_dissect = _dissect_header
+    ptype_name = property(_ptype_name)
+
 class LISP_MapReply(Packet):                                                    
     """ map reply part used after the first 16 bits have been read by the LISP_Type class"""
     name = "LISP Map-Reply packet"
@@ -224,46 +520,98 @@ class LISP_MapReply(Packet):
         FlagsField("reply_flags", None, 3, ["probe", "echo_nonce_alg", "security" ]),
         BitField("p2", 0, 9),        
         BitField("reserved", 0, 8),
-        FieldLenField("map_count", 0, "map_records", "B", count_of="map_records", adjust=lambda pkt,x:x/16 - 1),  
-	XLongField("nonce", random.randint(nonce_min, nonce_max)),
-        PacketListField("map_records", 0, LISP_MapRecord, count_from=lambda pkt:pkt.map_count + 1)
+        FieldLenField("map_count", None, fmt="B", count_of="map_records"),
+        XLongField("nonce", random.randint(nonce_min, nonce_max)),
+        LISP_MapRecordListField("map_records", None, LISP_MapRecord, count_from=lambda pkt: pkt.map_count)
     ]
 
+    _header = _MAP_REPLY_HEADER
+    _header_bits = (
+        (0, "ptype", 28, 0xf),
+        (0, "reply_flags", 25, 0x7),
+        (0, "p2", 16, 0x1ff),
+        (0, "reserved", 8, 0xff),
+        (0, "map_count", 0, 0xff),
+        (1, "nonce", 0, 0xffffffffffffffff)
+    )
+    do_dissect = _dissect_header
+    self_build = _build_header
+    ptype_name = property(_ptype_name)
+
+    @property
+    def records_soa(self):
+        """ the map records and their locators as columns, see _parse_records. this is parsed from the raw bytes of this layer on every access, the records start right after the 12 byte header. the record count is read from the built header as well, so it is the count that is actually sent """
+        p = self.self_build()
+        return _parse_records(p, _MAP_REPLY_HEADER.size, p[3])
+
+    @classmethod
+    def dissect_batch(cls, buffers):
+        """ dissects a list of raw map replies (each one starting at the map reply header) in one go, without building any packets. returns (replies, records, locators): replies holds the header columns "reply_flags", "map_count" and "nonce" in the order of buffers, records and locators are the columns of _parse_records for all replies together, with an additional "reply" column in records that holds the index of the buffer a record came from. every buffer must at least contain the 12 byte header, a shorter one raises a Scapy_Exception """
+        replies = { "reply_flags" : array("B"), "map_count" : array("B"), "nonce" : array("Q") }
+        records, locators = _parse_records(b"", 0, 0)
+        reply = array("I")
+        unpack = _MAP_REPLY_HEADER.unpack_from
+        size = _MAP_REPLY_HEADER.size
+        for i, s in enumerate(buffers):
+            if len(s) < size:
+                raise Scapy_Exception("LISP_MapReply.dissect_batch: buffer %d holds %d bytes, shorter than the map reply header" % (i, len(s)))
+            word, nonce = unpack(s)
+            count = word & 0xff
+            replies["reply_flags"].append((word >> 25) & 0x7)
+            replies["map_count"].append(count)
+            replies["nonce"].append(nonce)
+            _parse_records(s, size, count, records, locators)
+            reply.extend([i] * (len(records["record_ttl"]) - len(reply)))
+        records["reply"] = reply
+        return replies, records, locators
+
 class LISP_MapRegister(Packet):
     """ map reply part used after the first 16 bits have been read by the LISP_Type class"""
     name = "LISP Map-Register packet"
-    authentication_key = "password" # the key to use in the HMAC SHA computation
+    authentication_key = b"password" # the key to use in the HMAC SHA computation
     fields_desc = [ 
         BitField("ptype", 0, 4),
         FlagsField("register_flags", None, 4, ["proxy_map_reply", "lisp_sec", "itr_id_present", "rtr"]),
         BitField("p3", 0, 15),
         FlagsField("additional_register_flags", None, 1, ["want-map-notify"]),
-        FieldLenField("register_count", None, "register_records", "B", count_of="register_records", adjust=lambda pkt,x:x/16 - 1),
+        FieldLenField("register_count", None, fmt="B", count_of="register_records"),
         XLongField("nonce", random.randint(nonce_min, nonce_max)),
-	ShortField("key_id", 0),
+        ShortField("key_id", 0),
         ShortField("authentication_length", 0),
             # authentication length expresses itself in bytes, so no modifications needed here
         StrLenField("authentication_data", None, length_from = lambda pkt: pkt.authentication_length),
-        PacketListField("register_records", None, LISP_MapRecord, count_from=lambda pkt:pkt.register_count + 1),
+        LISP_MapRecordListField("register_records", None, LISP_MapRecord, count_from=lambda pkt: pkt.register_count),
         ConditionalField(XLongField("xtr_id_high", 0), lambda pkt:pkt.register_flags & 2 == 2),
         ConditionalField(XLongField("xtr_id_low", 0), lambda pkt:pkt.register_flags & 2 == 2),
         ConditionalField(XLongField("site_id", 0), lambda pkt:pkt.register_flags & 2 == 2)
     ]
 
+    _header = _MAP_AUTH_HEADER
+    _header_bits = (
+        (0, "ptype", 28, 0xf),
+        (0, "register_flags", 24, 0xf),
+        (0, "p3", 9, 0x7fff),
+        (0, "additional_register_flags", 8, 0x1),
+        (0, "register_count", 0, 0xff),
+        (1, "nonce", 0, 0xffffffffffffffff),
+        (2, "key_id", 0, 0xffff),
+        (3, "authentication_length", 0, 0xffff)
+    )
+    do_dissect = _dissect_header
+    self_build = _build_header
+    ptype_name = property(_ptype_name)
+    verify_auth = _verify_auth
+
     def post_build(self, p, pay):
         key_length = _KEY_LENGTH[self.key_id]
         if self.key_id == 0:
             # no HMAC
             return p
         # add authentication field with the correct length and bytes set to zero
-        self.authentication_data = '\x00' * key_length
+        self.authentication_data = b'\x00' * key_length
         p = p[:14] + struct.pack("!H", key_length) + self.authentication_data + p[16:]
-        if self.key_id == 1:
-            # compute HMAC-SHA1 checksum
-            self.authentication_data = hmac.new(self.authentication_key, msg=str(p), digestmod=hashlib.sha1).digest()
-        elif self.key_id == 2:
-            # compute HMAC-SHA256
-            self.authentication_data = hmac.new(self.authentication_key, msg=str(p), digestmod=hashlib.sha256).digest()
+        # compute HMAC-SHA1 or HMAC-SHA256 checksum
+        self.authentication_data = hmac.new(self.authentication_key, msg=p, digestmod=_KEY_DIGEST[self.key_id]).digest()
         p = p[:16] + self.authentication_data + p[(16+key_length):]
         return p
 
@@ -274,15 +622,29 @@ class LISP_MapNotify(Packet):
         BitField("ptype", 0, 4),
         BitField("reserved", 0, 12),
         ByteField("reserved_fields", 0),
-        FieldLenField("notify_count", None, "notify_records", "B", count_of="notify_records"),
-	XLongField("nonce", random.randint(nonce_min, nonce_max)),
+        FieldLenField("notify_count", None, fmt="B", count_of="notify_records"),
+        XLongField("nonce", random.randint(nonce_min, nonce_max)),
         ShortField("key_id", 0),
         ShortField("authentication_length", 0),
             # authentication length expresses itself in bytes, so no modifications needed here
         StrLenField("authentication_data", None, length_from = lambda pkt: pkt.authentication_length),
-        PacketListField("notify_records", None, LISP_MapRecord, count_from=lambda pkt: pkt.notify_count)
+        LISP_MapRecordListField("notify_records", None, LISP_MapRecord, count_from=lambda pkt: pkt.notify_count)
     ]
 
+    _header = _MAP_AUTH_HEADER
+    _header_bits = (
+        (0, "ptype", 28, 0xf),
+        (0, "reserved", 16, 0xfff),
+        (0, "reserved_fields", 8, 0xff),
+        (0, "notify_count", 0, 0xff),
+        (1, "nonce", 0, 0xffffffffffffffff),
+        (2, "key_id", 0, 0xffff),
+        (3, "authentication_length", 0, 0xffff)
+    )
+    do_dissect = _dissect_header
+    ptype_name = property(_ptype_name)
+    verify_auth = _verify_auth
+
 
 class LISP_GPE_Header(Packet):
     name = "LISP GPE Header"
@@ -298,10 +660,19 @@ class LISP_Encapsulated_Control_Message(Packet):
     name = "LISP Encapsulated Control Message packet"
     fields_desc = [
         BitField("ptype", 0, 4),	
-    	FlagsField("ecm_flags", None, 1, ["security"]),
-    	BitField("p8", 0, 27) 
+        FlagsField("ecm_flags", None, 1, ["security"]),
+        BitField("p8", 0, 27) 
     ]
 
+    _header = _ECM_HEADER
+    _header_bits = (
+        (0, "ptype", 28, 0xf),
+        (0, "ecm_flags", 27, 0x1),
+        (0, "p8", 0, 0x7ffffff)
+    )
+    do_dissect = _dissect_header
+    ptype_name = property(_ptype_name)
+
     """ Bind LISP into scapy stack
     
     According to http://www.iana.org/assignments/port-numbers :
@@ -310,11 +681,35 @@ class LISP_Encapsulated_Control_Message(Packet):
     lisp-cons       4342/tcp   LISP-CONS Control
     lisp-control    4342/udp   LISP Data-Triggered Control """
 
-    # tie LISP into the IP/UDP stack
-bind_layers( UDP, LISP, dport=4342 )
-bind_layers( UDP, LISP, sport=4342 )
-bind_layers( UDP, LISP_GPE_Header, dport=4341 )
-bind_layers( UDP, LISP_GPE_Header, sport=4341 )
+""" packet type (upper nibble of the first byte) to class, used by LISP.guess_payload_class. the table has a slot for each of the 16 possible types, so the lookup is a plain list index. unassigned types are left as raw payload """
+_LISP_PACKET_CLASSES = [conf.raw_layer] * 16
+_LISP_PACKET_CLASSES[1] = LISP_MapRequest
+_LISP_PACKET_CLASSES[2] = LISP_MapReply
+_LISP_PACKET_CLASSES[3] = LISP_MapRegister
+_LISP_PACKET_CLASSES[4] = LISP_MapNotify
+_LISP_PACKET_CLASSES[8] = LISP_Encapsulated_Control_Message
+
+    # tie LISP into the IP/UDP stack. the LISP ports are matched with plain integer compares instead of a field dict per binding. they are only checked once the stock UDP bindings found nothing, so a packet between a known port and a LISP port (e.g. DNS from port 53 to 4342) is dissected as before, like it was with bind_layers
+_udp_guess_payload_class = UDP.guess_payload_class
+
+def _lisp_udp_guess_payload_class(self, payload):
+    cls = _udp_guess_payload_class(self, payload)
+    if cls is not conf.raw_layer:
+        return cls
+    sport = self.sport
+    dport = self.dport
+    if dport == 4342 or sport == 4342:
+        return LISP
+    if dport == 4341 or sport == 4341:
+        return LISP_GPE_Header
+    return cls
+
+UDP.guess_payload_class = _lisp_udp_guess_payload_class
+    # building still needs the bindings to fill in the ports
+bind_top_down( UDP, LISP, dport=4342 )
+bind_top_down( UDP, LISP, sport=4342 )
+bind_top_down( UDP, LISP_GPE_Header, dport=4341 )
+bind_top_down( UDP, LISP_GPE_Header, sport=4341 )
 bind_layers( LISP_GPE_Header, IP, next_proto=1 )
 bind_layers( LISP_GPE_Header, IPv6, next_proto=2 )
 bind_layers( LISP_GPE_Header, Ether, next_proto=3 )
@@ -6,7 +6,8 @@ except ImportError:
 setup(name='py_lispnetworking',
       packages=['py_lispnetworking'],
       package_dir = {'py_lispnetworking': '.'},
-      install_requires=['netifaces', 'scapy'],
+      install_requires=['netifaces', 'scapy>=2.5.0,<2.7'],
+      python_requires='>=3.7',
       version='1.2',
       description='py_lispnetworking',
       long_description='''py-lispnetworking - A python module to deal with LISP control-plane packets''',
@@ -0,0 +1,76 @@
+""" dissects the packets in captures/ and builds them again, an unchanged packet has to come out exactly as it was captured """
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from lisp import *
+
+CAPTURES = os.path.join(os.path.dirname(HERE), "captures")
+
+
+def lisp_packets():
+    for name in sorted(os.listdir(CAPTURES)):
+        if not name.endswith(".pcap"):
+            continue
+        for p in rdpcap(os.path.join(CAPTURES, name)):
+            if UDP in p and (LISP in p or LISP_GPE_Header in p):
+                yield name, bytes(p[UDP])
+
+
+class CaptureTest(unittest.TestCase):
+
+    def test_rebuild_unchanged(self):
+        count = 0
+        for name, raw in lisp_packets():
+            self.assertEqual(bytes(UDP(raw)), raw, name)
+            count += 1
+        self.assertTrue(count > 0)
+
+    def test_rebuild_changed_record(self):
+        for name, raw in lisp_packets():
+            p = UDP(raw)
+            if LISP_MapReply in p and p[LISP_MapReply].map_records:
+                p[LISP_MapReply].map_records[0].record_ttl = 12345
+                self.assertEqual(LISP_MapReply(bytes(p[LISP_MapReply])).map_records[0].record_ttl, 12345)
+                return
+        self.fail("no map reply with records in captures/")
+
+    def test_clone_keeps_records(self):
+        # send() and sr() go through Packet.__iter__, which clones every layer
+        for name, raw in lisp_packets():
+            p = UDP(raw)
+            if LISP_MapReply in p and p[LISP_MapReply].map_count:
+                clone = next(iter(p))
+                clone[LISP_MapReply].nonce = 1
+                self.assertEqual(len(bytes(clone)), len(raw), name)
+                self.assertEqual(len(clone[LISP_MapReply].map_records), p[LISP_MapReply].map_count, name)
+
+    def test_command_keeps_records(self):
+        count = 0
+        for name, raw in lisp_packets():
+            p = UDP(raw)
+            if LISP_MapReply in p and p[LISP_MapReply].map_count:
+                reply = p[LISP_MapReply]
+                self.assertEqual(bytes(eval(reply.command())), bytes(reply), name)
+                count += 1
+        self.assertTrue(count > 0)
+
+    def test_payload_after_records(self):
+        for name, raw in lisp_packets():
+            p = UDP(raw)
+            if LISP_MapReply in p and p[LISP_MapReply].map_count:
+                reply = LISP_MapReply(bytes(p[LISP_MapReply]) + b"trailer")
+                # the payload is there before the records are looked at
+                self.assertEqual(reply.payload.load, b"trailer", name)
+                self.assertEqual(reply.lastlayer().load, b"trailer", name)
+                self.assertIn(Raw, reply.layers())
+                self.assertEqual(len(reply.map_records), reply.map_count, name)
+                return
+        self.fail("no map reply with records in captures/")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+""" UDP dissection: the LISP control and data ports """
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from lisp import *
+
+
+class PortTest(unittest.TestCase):
+
+    def test_control_port(self):
+        for ports in ({"sport": 1234, "dport": 4342}, {"sport": 4342, "dport": 1234}):
+            p = UDP(bytes(UDP(**ports) / LISP() / LISP_MapReply(ptype=2, nonce=7)))
+            self.assertIn(LISP, p)
+            self.assertEqual(p[LISP_MapReply].nonce, 7)
+
+    def test_data_port(self):
+        for ports in ({"sport": 1234, "dport": 4341}, {"sport": 4341, "dport": 1234}):
+            p = UDP(bytes(UDP(**ports) / LISP_GPE_Header() / IP(dst="192.0.2.1")))
+            self.assertIn(LISP_GPE_Header, p)
+            self.assertEqual(p[IP].dst, "192.0.2.1")
+
+    def test_other_binding_first(self):
+        # DNS from port 53 to the LISP control port is still DNS
+        p = UDP(bytes(UDP(sport=53, dport=4342) / DNS(qd=DNSQR(qname="example.com"))))
+        self.assertIn(DNS, p)
+        self.assertNotIn(LISP, p)
+
+    def test_unknown_port(self):
+        p = UDP(bytes(UDP(sport=1234, dport=4343) / b"data"))
+        self.assertNotIn(LISP, p)
+        self.assertEqual(p[Raw].load, b"data")
+
+
+if __name__ == "__main__":
+    unittest.main()
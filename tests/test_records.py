@@ -0,0 +1,127 @@
+""" map record dissection: the record cache and the column oriented bulk parser """
+import os
+import socket
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import lisp
+from lisp import *
+from test_captures import lisp_packets
+
+
+def map_reply():
+    locators = [LISP_Locator_Record(priority=1, weight=50, locator_flags="probe", address="192.0.2.1"),
+                LISP_Locator_Record(locator_afi=2, address="2001:db8::1")]
+    record = LISP_MapRecord(record_ttl=1440, eid_prefix_length=24, locator_count=2, locators=locators, record_address="10.0.0.0")
+    return bytes(LISP_MapReply(ptype=2, nonce=1, map_count=1, map_records=[record]))
+
+
+class RecordCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        lisp._map_record_cache.clear()
+
+    def test_hit(self):
+        raw = map_reply()
+        first = LISP_MapReply(raw)
+        second = LISP_MapReply(raw)
+        self.assertEqual(repr(first.map_records), repr(second.map_records))
+        self.assertEqual(len(lisp._map_record_cache), 1)
+        self.assertIsNot(first.map_records[0], second.map_records[0])
+        self.assertEqual(bytes(second), raw)
+        self.assertEqual(bytes(second.map_records[0]), bytes(first.map_records[0]))
+        if hasattr(second.map_records[0], "parent"):
+            self.assertIs(second.map_records[0].parent, second)
+            self.assertIs(second.map_records[0].locators[0].parent, second.map_records[0])
+
+    def test_change_after_hit(self):
+        raw = map_reply()
+        LISP_MapReply(raw)
+        changed = LISP_MapReply(raw)
+        changed.map_records[0].record_ttl = 7
+        changed.map_records[0].locators[0].locator_flags = "route"
+        rebuilt = LISP_MapReply(bytes(changed))
+        self.assertEqual(rebuilt.map_records[0].record_ttl, 7)
+        self.assertEqual(rebuilt.map_records[0].locators[0].locator_flags, "route")
+        again = LISP_MapReply(raw)
+        self.assertEqual(again.map_records[0].record_ttl, 1440)
+        self.assertEqual(again.map_records[0].locators[0].locator_flags, "probe")
+        self.assertEqual(bytes(again), raw)
+
+
+def mixed_reply():
+    locators = [LISP_Locator_Record(priority=1, weight=10, locator_flags="route", address="192.0.2.1"),
+                LISP_Locator_Record(locator_afi=2, priority=2, weight=20, address="2001:db8::1")]
+    records = [LISP_MapRecord(record_ttl=60, eid_prefix_length=24, action=1, authoritative=1, map_version_number=5, record_address="10.0.0.0",
+                              locator_count=2, locators=locators),
+               LISP_MapRecord(record_ttl=120, eid_prefix_length=48, record_afi=2, record_address="2001:db8:1::",
+                              locator_count=1, locators=[LISP_Locator_Record(address="198.51.100.7")])]
+    return LISP_MapReply(ptype=2, reply_flags="probe", nonce=42, map_records=records)
+
+
+def packed(afi, address):
+    return socket.inet_pton(socket.AF_INET if afi == 1 else socket.AF_INET6, address)
+
+
+class BulkParseTest(unittest.TestCase):
+
+    def assertColumns(self, records, locators, replies):
+        # replies is a list of dissected LISP_MapReply layers, in the order their records appear in the columns
+        i = 0
+        l = 0
+        for n, reply in enumerate(replies):
+            for record in reply.map_records:
+                if not isinstance(record, LISP_MapRecord):
+                    # e.g. an LCAF address that scapy keeps as raw data, the bulk parser stops there as well
+                    break
+                self.assertEqual(records["record_ttl"][i], record.record_ttl)
+                self.assertEqual(records["locator_count"][i], record.locator_count)
+                self.assertEqual(records["eid_prefix_length"][i], record.eid_prefix_length)
+                self.assertEqual(records["action_flags"][i], record.action << 29 | record.authoritative << 28 | record.reserved << 12 | record.map_version_number)
+                self.assertEqual(records["record_afi"][i], record.record_afi)
+                self.assertEqual(records["record_address"][i], packed(record.record_afi, record.record_address))
+                if "reply" in records:
+                    self.assertEqual(records["reply"][i], n)
+                for locator in record.locators:
+                    self.assertEqual(locators["record"][l], i)
+                    for name in ("priority", "weight", "multicast_priority", "multicast_weight", "locator_afi"):
+                        self.assertEqual(locators[name][l], getattr(locator, name))
+                    self.assertEqual(locators["locator_flags"][l], int(locator.locator_flags))
+                    self.assertEqual(locators["address"][l], packed(locator.locator_afi, locator.address))
+                    l += 1
+                i += 1
+        self.assertEqual(len(records["record_ttl"]), i)
+        self.assertEqual(len(locators["record"]), l)
+
+    def capture_replies(self):
+        replies = [UDP(raw)[LISP_MapReply] for name, raw in lisp_packets() if LISP_MapReply in UDP(raw)]
+        self.assertTrue(replies)
+        return replies
+
+    def test_records_soa_captures(self):
+        for reply in self.capture_replies():
+            self.assertColumns(*reply.records_soa, replies=[reply])
+
+    def test_records_soa_built(self):
+        reply = mixed_reply()
+        self.assertColumns(*reply.records_soa, replies=[LISP_MapReply(bytes(reply))])
+
+    def test_dissect_batch(self):
+        replies = self.capture_replies() + [LISP_MapReply(bytes(mixed_reply()))]
+        header, records, locators = LISP_MapReply.dissect_batch([bytes(r) for r in replies])
+        self.assertEqual(list(header["nonce"]), [r.nonce for r in replies])
+        self.assertEqual(list(header["map_count"]), [r.map_count for r in replies])
+        self.assertEqual(list(header["reply_flags"]), [int(r.reply_flags) for r in replies])
+        self.assertColumns(records, locators, replies)
+
+    def test_short_buffer(self):
+        raw = bytes(mixed_reply())
+        self.assertRaises(Scapy_Exception, LISP_MapReply.dissect_batch, [raw, raw[:11]])
+        self.assertRaises(Scapy_Exception, LISP_MapReply.dissect_batch, [b""])
+
+
+if __name__ == "__main__":
+    unittest.main()